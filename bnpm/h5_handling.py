@@ -1,14 +1,64 @@
 import gc
+import sys
 from pathlib import Path
+import weakref
 
 import h5py
 import numpy as np
 
-def close_all_h5():
+## Registry of h5 files opened through open_h5: {id(file): weakref to file}.
+##  Keyed on object identity because h5py.File hashes and compares by the
+##  underlying HDF5 file id, so two handles to the same path would collide
+##  in a WeakSet. Entries are removed when the file object is garbage
+##  collected.
+_OPEN_FILES = {}
+
+
+def open_h5(path, mode='r', **kwargs):
+    '''
+    Opens an h5 file and registers it so that close_all_h5 can find it.
+
+    Args:
+        path (string or Path):
+            Path to the h5 file
+        mode (str):
+            Mode to open the file with. See h5py.File
+        **kwargs:
+            Passed to h5py.File
+
+    Returns:
+        h5py.File object
+    '''
+    f = h5py.File(path, mode, **kwargs)
+    _OPEN_FILES[id(f)] = weakref.ref(f)
+    weakref.finalize(f, _OPEN_FILES.pop, id(f), None)
+    return f
+
+
+def close_all_h5(fallback=False):
     '''
-    Closes all h5 objects in workspace. Not tested thoroughly.
-    from here: https://stackoverflow.com/questions/29863342/close-an-open-h5py-data-file
+    Closes all h5 files opened with open_h5.
+
+    Args:
+        fallback (bool):
+            If True, also scan every object in the workspace (gc.get_objects)
+             for open h5py.File objects. This is slow and not tested
+             thoroughly.
+             from here: https://stackoverflow.com/questions/29863342/close-an-open-h5py-data-file
     '''
+    for ref in list(_OPEN_FILES.values()):
+        f = ref()
+        if f is None:
+            continue
+        try:
+            f.close()
+        except:
+            pass # Was already closed
+    _OPEN_FILES.clear()
+
+    if not fallback:
+        return
+
     try:
         for obj in gc.get_objects():   # Browse through ALL objects
             if isinstance(obj, h5py.File):   # Just HDF5 files
@@ -55,10 +105,12 @@ def show_group_items(hObj):
 
 
 
-def show_item_tree(hObj=None , path=None, depth=None, show_metadata=True, print_metadata=False, indent_level=0):
+def show_item_tree(hObj=None , path=None, depth=None, show_metadata=True, print_metadata=False, indent_level=0, _buf=None):
     '''
-    Recursive function that displays all the items 
-     and groups in an h5 object or python dict
+    Function that displays all the items 
+     and groups in an h5 object or python dict.
+    The tree is traversed with an explicit stack and stops at depth.
+    Lines are collected and written to stdout in a single call.
     RH 2021
 
     Args:
@@ -74,6 +126,10 @@ def show_item_tree(hObj=None , path=None, depth=None, show_metadata=True, print_
             whether or not to show values of metadata items
         indent_level: 
             used internally to function. User should leave blank
+        _buf (list):
+            used internally to function. User should leave blank.
+            If not None, lines are appended to this list instead of
+             being written to stdout.
 
     ##############
     
@@ -90,64 +146,126 @@ def show_item_tree(hObj=None , path=None, depth=None, show_metadata=True, print_
     if depth < 0:
         return
 
+    top_level = _buf is None
+    buf = [] if top_level else _buf
+
+    def add_metadata_lines(obj, indent):
+        if hasattr(obj, 'attrs') and show_metadata:
+            for ii,val in enumerate(list(obj.attrs.keys()) ):
+                if print_metadata:
+                    buf.append(f'{indent}METADATA: {val}: {obj.attrs[val]}')
+                else:
+                    buf.append(f'{indent}METADATA: {val}: shape={obj.attrs[val].shape} , dtype={obj.attrs[val].dtype}')
+
+    def add_item_line(obj, key, ii, indent):
+        if isinstance(obj, (h5py.Group, dict)):
+            buf.append(f'{indent}{ii+1}. {key}:----------------')
+        elif hasattr(obj, 'shape') and hasattr(obj, 'dtype'):
+            buf.append(f'{indent}{ii+1}. {key}:    '.ljust(20) + f'shape={obj.shape} ,'.ljust(20) + f'dtype={obj.dtype}')
+        else:
+            buf.append(f'{indent}{ii+1}. {key}:    '.ljust(20) + f'type={type(obj)}')
+
     if path is not None:
         with h5py.File(path , 'r') as f:
-            show_item_tree(hObj=f, path=None, depth=depth-1, show_metadata=show_metadata, print_metadata=print_metadata, indent_level=indent_level)
+            show_item_tree(hObj=f, path=None, depth=depth-1, show_metadata=show_metadata, print_metadata=print_metadata, indent_level=indent_level, _buf=buf)
     else:
-        indent = f'  '*indent_level
-        if hasattr(hObj, 'attrs') and show_metadata:
-            for ii,val in enumerate(list(hObj.attrs.keys()) ):
-                if print_metadata:
-                    print(f'{indent}METADATA: {val}: {hObj.attrs[val]}')
-                else:
-                    print(f'{indent}METADATA: {val}: shape={hObj.attrs[val].shape} , dtype={hObj.attrs[val].dtype}')
-        
-        for ii,val in enumerate(list(iter(hObj))):
-            if isinstance(hObj[val], h5py.Group):
-                print(f'{indent}{ii+1}. {val}:----------------')
-                show_item_tree(hObj[val], depth=depth-1, show_metadata=show_metadata, print_metadata=print_metadata , indent_level=indent_level+1)
-            elif isinstance(hObj[val], dict):
-                print(f'{indent}{ii+1}. {val}:----------------')
-                show_item_tree(hObj[val], depth=depth-1, show_metadata=show_metadata, print_metadata=print_metadata , indent_level=indent_level+1)
+        add_metadata_lines(hObj, f'  '*indent_level)
+
+        ## Stack of (level, iterator over (index, (key, value))). h5 groups
+        ##  iterate in creation order when it is tracked, and each child is
+        ##  opened once.
+        stack = [(0, enumerate(hObj.items()))]
+        while stack:
+            level, items = stack[-1]
+            indent = f'  '*(indent_level + level)
+            for ii,(key,val) in items:
+                add_item_line(val, key, ii, indent)
+                if isinstance(val, (h5py.Group, dict)) and (level + 1 <= depth):
+                    ## Descend into the subgroup before continuing with siblings
+                    add_metadata_lines(val, f'  '*(indent_level + level + 1))
+                    stack.append((level + 1, enumerate(val.items())))
+                    break
             else:
-                if hasattr(hObj[val], 'shape') and hasattr(hObj[val], 'dtype'):
-                    print(f'{indent}{ii+1}. {val}:    '.ljust(20) + f'shape={hObj[val].shape} ,'.ljust(20) + f'dtype={hObj[val].dtype}')
-                else:
-                    print(f'{indent}{ii+1}. {val}:    '.ljust(20) + f'type={type(hObj[val])}')
+                stack.pop()
 
+    if top_level and len(buf) > 0:
+        sys.stdout.write('\n'.join(buf) + '\n')
 
-def make_h5_tree(dict_obj , h5_obj , group_string='', use_compression=False, track_order=True):
+
+def make_h5_tree(dict_obj , h5_obj , group_string='', use_compression=False, track_order=True, dataset_kwargs=None):
     '''
     This function is meant to be called by write_dict_to_h5. It probably shouldn't be called alone.
     This function creates an h5 group and dataset tree structure based on the hierarchy and values within a python dict.
-    There is a recursion in this function.
+    The dict is traversed depth-first using an explicit stack, and each
+     h5 group is opened once and reused for all of its children.
+    See write_dict_to_h5 for a description of dataset_kwargs.
     RH 2021
     '''
     ## Set track_order to True to keep track of the order of the items in the dict
     ##  This is useful for reading the dict back in from the h5 file
     h5py.get_config().track_order = track_order
-    for ii,(key,val) in enumerate(dict_obj.items()):
-        if group_string=='':
-            group_string='/'
-        if isinstance(val , dict):
-            # print(f'making group:  {key}')
-            h5_obj[group_string].create_group(key)
-            make_h5_tree(val , h5_obj[group_string] , f'{group_string}/{key}', use_compression=use_compression)
-        else:
+
+    kwargs_compression = {'compression': 'gzip', 'compression_opts': 9} if use_compression else {}
+
+    group_root = h5_obj if group_string in ('', '/') else h5_obj.require_group(group_string)
+    prefix_root = group_string.strip('/') + '/' if group_string.strip('/') else ''
+    ## Stack of (h5 group, iterator over the matching dict's items, path prefix)
+    stack = [(group_root, iter(dict_obj.items()), prefix_root)]
+    while stack:
+        group, items, prefix = stack[-1]
+        for key, val in items:
+            if isinstance(val , dict):
+                ## Descend into the subgroup before continuing with siblings
+                stack.append((group.require_group(key), iter(val.items()), f'{prefix}{key}/'))
+                break
+
             ## cast to 'S' type if string so that it doesn't become '|O' object type in h5 file
             if isinstance(val, str):
-                val = np.array(val, dtype=np.string_)
-            
-            # print(f'saving:  {group_string}: {key}')
-            kwargs_compression = {'compression': 'gzip', 'compression_opts': 9} if use_compression else {}
-            h5_obj[group_string].create_dataset(key , data=val, **kwargs_compression)
+                val = np.array(val, dtype=np.bytes_)
+            ## contiguous numeric arrays are written without an extra copy in h5py.
+            ##  0-d arrays are skipped: ascontiguousarray would make them 1-D.
+            elif isinstance(val, np.ndarray) and val.ndim > 0 and val.dtype.kind in 'biufc':
+                val = np.ascontiguousarray(val)
+
+            ## shape and size from the array already held; only convert other leaves (e.g. lists)
+            arr = val if isinstance(val, np.ndarray) else np.asarray(val)
+            nbytes = arr.nbytes
+            if arr.shape == ():
+                ## scalar datasets can't be chunked or filtered in h5py
+                kwargs_dataset = {'chunks': None, 'compression': None}
+            elif nbytes < 64*1024:
+                ## small leaves use contiguous layout (no chunk B-tree) unless
+                ##  compression was requested, which requires chunking
+                kwargs_dataset = dict(kwargs_compression) if use_compression else {'chunks': None}
+            elif nbytes >= 1024**2 and isinstance(val, np.ndarray) and val.dtype.kind in 'biufc':
+                ## chunk and compress large numeric arrays. LZF is fast enough that
+                ##  the smaller write usually outweighs its CPU cost.
+                kwargs_dataset = {'chunks': True, 'shuffle': True, **(kwargs_compression or {'compression': 'lzf'})}
+            elif nbytes >= 1024**2:
+                ## chunk large arrays so that later partial reads don't load everything
+                kwargs_dataset = {**kwargs_compression, 'chunks': True}
+            else:
+                kwargs_dataset = dict(kwargs_compression)
+
+            ## user specified kwargs take precedence
+            if dataset_kwargs is not None:
+                path = f'{prefix}{key}'
+                kwargs_user = dataset_kwargs(path, val) if callable(dataset_kwargs) else dataset_kwargs.get(path, None)
+                kwargs_dataset.update(kwargs_user or {})
+            group.create_dataset(key , data=val, **kwargs_dataset)
+        else:
+            stack.pop()
+
+
 def write_dict_to_h5(
     path_save, 
     input_dict, 
     use_compression=False, 
     track_order=True, 
     write_mode='w-', 
-    show_item_tree_pref=True
+    show_item_tree_pref=True,
+    libver='latest',
+    dataset_kwargs=None,
 ):
     '''
     Writes an h5 file that matches the hierarchy and data within a python dict.
@@ -167,9 +285,31 @@ def write_dict_to_h5(
             The priveleges of the h5 file object. 'w' will overwrite. 'w-' will not overwrite
         show_item_tree_pref (bool): 
             Whether you'd like to print the item tree or not
+        libver (str or tuple):
+            HDF5 file format version bounds. See h5py.File.
+            'latest' uses the newest object header format, which is smaller
+             and faster to write and read back, but the file may not be
+             readable by HDF5 libraries older than the one that wrote it.
+             Use 'earliest' if the file needs to be read by older HDF5
+             libraries.
+        dataset_kwargs (dict or callable):
+            Extra keyword arguments for h5py's create_dataset, for example
+             chunks, compression, and shuffle. Either a dict mapping dataset
+             paths (e.g. 'group/subgroup/key') to dicts of kwargs, or a
+             function with signature fn(path, value) that returns a dict of
+             kwargs or None. These override the defaults:
+                - < 64KB: contiguous layout, no compression
+                - >= 1MB numeric arrays: chunks=True, shuffle=True,
+                  compression='lzf' (or gzip if use_compression)
+            LZF is an h5py-specific filter. Files containing LZF datasets
+             can't be read by MATLAB, h5dump, or other HDF5 C/Java readers
+             unless the LZF plugin is installed. Use use_compression=True
+             (gzip), or dataset_kwargs=lambda path, val: {'compression': None},
+             if the file needs to be read outside of h5py.
     '''
-    with h5py.File(path_save , write_mode) as hf:
-        make_h5_tree(input_dict , hf , '', use_compression=use_compression, track_order=track_order)
+    ## rdcc_*: 16MB raw data chunk cache with a prime number of hash slots
+    with h5py.File(path_save , write_mode, libver=libver, rdcc_nbytes=16*1024**2, rdcc_nslots=10007) as hf:
+        make_h5_tree(input_dict , hf , '', use_compression=use_compression, track_order=track_order, dataset_kwargs=dataset_kwargs)
         if show_item_tree_pref:
             print(f'==== Successfully wrote h5 file. Displaying h5 hierarchy ====')
             show_item_tree(hf)
@@ -210,7 +350,7 @@ def simple_load(filepath, return_dict=True, verbose=False):
             h5_file.visititems(visitor_func)            
             return result
     else:
-        result = h5py.File(filepath, 'r')
+        result = open_h5(filepath, 'r')
         show_item_tree(result) if verbose else None
         return result
 
@@ -236,6 +376,7 @@ def simple_save(
     write_mode='w-', 
     mkdir=True,
     verbose=False,
+    dataset_kwargs=None,
 ):
     """
     Saves a python dict to an hdf file.
@@ -259,6 +400,12 @@ def simple_save(
             Whether or not to keep track of the order of the items in the dict
         verbose (bool):
             Whether or not to print out the h5 file hierarchy.
+        dataset_kwargs (dict or callable):
+            Extra keyword arguments for creating datasets.
+            See write_dict_to_h5.
+            Note: by default, numeric arrays >= 1MB are written with LZF
+             compression, which is only readable by h5py (or HDF5 with the
+             LZF plugin). Set use_compression=True to use gzip instead.
     """
 
     if mkdir:
@@ -270,7 +417,8 @@ def simple_save(
         use_compression=use_compression, 
         track_order=track_order,
         write_mode=write_mode, 
-        show_item_tree_pref=verbose
+        show_item_tree_pref=verbose,
+        dataset_kwargs=dataset_kwargs,
     )
 
 
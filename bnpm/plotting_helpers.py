@@ -6,6 +6,7 @@ from PIL import ImageTk
 import csv
 import warnings
 import time
+import functools
 
 from matplotlib import pyplot as plt
 import numpy as np
@@ -20,7 +21,7 @@ from . import math_functions
 #### PLOTS ####
 ###############
 
-def plot_image_grid(images, labels=None, grid_shape=(10,10), show_axis='off', cmap=None, kwargs_subplots={}, kwargs_imshow={}):
+def plot_image_grid(images, labels=None, grid_shape=(10,10), show_axis='off', cmap=None, kwargs_subplots={}, kwargs_imshow={}, fast=False):
     """
     Plot a grid of images
     RH 2021
@@ -41,18 +42,28 @@ def plot_image_grid(images, labels=None, grid_shape=(10,10), show_axis='off', cm
             Keyword arguments for subplots
         kwargs_imshow (dict):
             Keyword arguments for imshow
+        fast (bool):
+            If True and all images have the same shape, the images are tiled
+             into a single mosaic and drawn with one imshow call on one
+             Axes. All tiles then share the same color scaling, and labels
+             are drawn as text at the top of each tile. If the shapes
+             differ, the normal grid of Axes is used.
     
     Returns:
         fig:
             Figure
         axs:
-            Axes
+            Axes. A single Axes if the mosaic was used.
     """
     if cmap is None:
         cmap = 'viridis'
 
+    if fast and len(images) > 0 and all(im.shape == images[0].shape for im in images):
+        return _plot_image_mosaic(images, labels=labels, grid_shape=grid_shape, show_axis=show_axis, cmap=cmap, kwargs_subplots=kwargs_subplots, kwargs_imshow=kwargs_imshow)
+
     fig, axs = plt.subplots(nrows=grid_shape[0], ncols=grid_shape[1], **kwargs_subplots)
-    axs_flat = axs.flatten(order='F') if isinstance(axs, np.ndarray) else [axs]
+    ## axs.T.flat iterates in column-major order without copying axs
+    axs_flat = list(axs.T.flat) if isinstance(axs, np.ndarray) else [axs]
     for ii, ax in enumerate(axs_flat[:len(images)]):
         ax.imshow(images[ii], cmap=cmap, **kwargs_imshow);
         if labels is not None:
@@ -61,6 +72,41 @@ def plot_image_grid(images, labels=None, grid_shape=(10,10), show_axis='off', cm
     return fig, axs
 
 
+def _plot_image_mosaic(images, labels, grid_shape, show_axis, cmap, kwargs_subplots, kwargs_imshow):
+    """
+    Helper for plot_image_grid(fast=True). Tiles same-shaped images into one
+     image in column-major order, matching the order of the Axes grid.
+    """
+    n_rows, n_cols = grid_shape
+    n_cells = n_rows * n_cols
+    images = np.asarray(images[:n_cells])
+    h, w = images.shape[1:3]
+
+    ## Fill empty cells with NaN (or 0 for integer images)
+    if images.shape[0] < n_cells:
+        fill = np.nan if images.dtype.kind in 'fc' else 0
+        pad = np.full((n_cells - images.shape[0],) + images.shape[1:], fill, dtype=images.dtype)
+        images = np.concatenate([images, pad], axis=0)
+
+    ## (n_cols, n_rows, h, w, ...) -> (n_rows, h, n_cols, w, ...) -> (n_rows*h, n_cols*w, ...)
+    mosaic = images.reshape((n_cols, n_rows, h, w) + images.shape[3:])
+    mosaic = np.moveaxis(mosaic, [0, 1], [2, 0]).reshape((n_rows * h, n_cols * w) + images.shape[3:])
+
+    fig, ax = plt.subplots(**kwargs_subplots)
+    ax.imshow(mosaic, cmap=cmap, **{'interpolation': 'nearest', **kwargs_imshow})
+
+    ## Tile separators
+    ax.vlines(np.arange(1, n_cols) * w - 0.5, -0.5, n_rows * h - 0.5, colors='w', linewidths=1)
+    ax.hlines(np.arange(1, n_rows) * h - 0.5, -0.5, n_cols * w - 0.5, colors='w', linewidths=1)
+
+    if labels is not None:
+        for ii, label in enumerate(labels[:n_cells]):
+            i_row, i_col = ii % n_rows, ii // n_rows
+            ax.text(i_col * w + w / 2, i_row * h, str(label), ha='center', va='top', color='w', fontsize='small')
+    ax.axis(show_axis);
+    return fig, ax
+
+
 def widget_toggle_image_stack(images, labels=None, clim=None, figsize=None):
     """
     Scrub through imaes in a stack using a slider.
@@ -71,21 +117,36 @@ def widget_toggle_image_stack(images, labels=None, clim=None, figsize=None):
         images (list of 2D arrays):
             List of images
         clim (tuple):
-            Limits of the colorbar
+            Limits of the colorbar.
+            If None, the (min, max) of each image is used, ignoring NaNs.
     """
     from ipywidgets import interact, widgets
 
+    ## Precompute color limits once so that slider events don't rescale
+    if clim is None:
+        if isinstance(images, np.ndarray) and images.ndim == 3:
+            clims = list(zip(np.nanmin(images, axis=(1,2)), np.nanmax(images, axis=(1,2))))
+        else:
+            clims = [(np.nanmin(im), np.nanmax(im)) for im in images]
+    else:
+        clims = [tuple(clim)] * len(images)
+
     fig = plt.figure(figsize=figsize)
     ax = fig.add_subplot(1, 1, 1)
     imshow_FOV = ax.imshow(
         images[0],
-#         vmax=clim[1]
+        interpolation='nearest',
+        vmin=clims[0][0],
+        vmax=clims[0][1],
     )
+    last_clim = [clims[0]]
 
     def update(i_frame = 0):
         fig.canvas.draw_idle()
         imshow_FOV.set_data(images[i_frame])
-        imshow_FOV.set_clim(clim)
+        if clims[i_frame] != last_clim[0]:
+            imshow_FOV.set_clim(clims[i_frame])
+            last_clim[0] = clims[i_frame]
         if labels is not None:
             ax.set_title(labels[i_frame])
 
@@ -230,7 +291,7 @@ def display_toggle_image_stack(
     display(HTML(html_code))
 
 
-def plot_to_image(fig, keep_alpha=True):
+def plot_to_image(fig, keep_alpha=True, copy=True):
     """
     Convert a matplotlib figure to a numpy array image.
     Recommendations:
@@ -243,6 +304,13 @@ def plot_to_image(fig, keep_alpha=True):
     Args:
         fig (matplotlib.figure):
             figure to convert to numpy array.
+        keep_alpha (bool):
+            If True, output has 4 channels (RGBA). If False, output has 3
+             channels (RGB).
+        copy (bool):
+            If True, return a copy of the canvas buffer. If False, return a
+             view into the Agg canvas's RGBA buffer. The view
+             is overwritten by the next draw of the figure.
     
     Returns:
         image (np.array):
@@ -250,13 +318,21 @@ def plot_to_image(fig, keep_alpha=True):
             shape: (height, width, n_channels:4)
     """
 
-    fig.canvas.draw()
-    if keep_alpha:
-        image = np.frombuffer(fig.canvas.tostring_argb(), dtype=np.uint8)
-        image = image.reshape(fig.canvas.get_width_height()[::-1] + (4,))[...,(1,2,3,0)]
-    else:
-        image = np.frombuffer(fig.canvas.tostring_rgb(), dtype=np.uint8)
-        image = image.reshape(fig.canvas.get_width_height()[::-1] + (3,))
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    ## Render with Agg even if the figure belongs to another backend (e.g.
+    ##  Cairo). The original canvas is restored afterwards.
+    canvas_orig = fig.canvas
+    canvas = canvas_orig if isinstance(canvas_orig, FigureCanvasAgg) else FigureCanvasAgg(fig)
+    try:
+        canvas.draw()
+        ## Agg canvases expose their RGBA8888 buffer directly: shape (H, W, 4)
+        image = np.asarray(canvas.buffer_rgba())
+        image = image if keep_alpha else image[..., :3]
+        image = image.copy() if copy else image
+    finally:
+        if canvas is not canvas_orig:
+            fig.set_canvas(canvas_orig)
     
     return image
 
@@ -457,8 +533,18 @@ def get_subplot_indices(axs):
         list of indices
     
     """
-    out_array = np.stack(np.unravel_index(np.arange(np.prod(axs.shape)), axs.shape, order='F'), axis=-1)
-    return [tuple(ii) for ii in out_array]
+    return list(_subplot_indices_for_shape(tuple(axs.shape)))
+
+
+@functools.lru_cache(maxsize=64)
+def _subplot_indices_for_shape(shape):
+    """
+    Cached helper for get_subplot_indices. Returns a tuple of index tuples
+     in column-major (Fortran) order.
+    """
+    ## Iterating the reversed shape in C order and reversing each index
+    ##  gives column-major order
+    return tuple(idx[::-1] for idx in np.ndindex(*shape[::-1]))
 
 
 def rand_cmap(
@@ -467,6 +553,7 @@ def rand_cmap(
     first_color_black=False, 
     last_color_black=False,
     verbose=True,
+    show_colorbar=False,
     under=[0,0,0],
     over=[0.5,0.5,0.5],
     bad=[0.9,0.9,0.9],
@@ -474,14 +561,14 @@ def rand_cmap(
     """
     Creates a random colormap to be used together with matplotlib. Useful for segmentation tasks
     :param nlabels: Number of labels (size of colormap)
-    :param type: 'bright' for strong colors, 'soft' for pastel colors
+    :param type: 'bright' for strong colors, 'soft' for pastel colors, 'random' for uniform random RGB
     :param first_color_black: Option to use first color as black, True or False
     :param last_color_black: Option to use last color as black, True or False
-    :param verbose: Prints the number of labels and shows the colormap. True or False
+    :param verbose: Prints the number of labels. True or False
+    :param show_colorbar: Shows the colormap as a colorbar. Can also be done later with cmap.show_preview(). True or False
     :return: colormap for matplotlib
     """
-    from matplotlib.colors import LinearSegmentedColormap
-    import colorsys
+    from matplotlib.colors import LinearSegmentedColormap, hsv_to_rgb
     import numpy as np
 
     assert nlabels > 0, 'Number of labels must be greater than 0'
@@ -494,21 +581,19 @@ def rand_cmap(
     if verbose:
         print('Number of labels: ' + str(nlabels))
 
-#     # Generate color map for bright colors, based on hsv
-#     if type == 'bright':
-#         randHSVcolors = [(np.random.uniform(low=0.0, high=1),
-#                           np.random.uniform(low=0.2, high=1),
-# #                           np.random.uniform(low=0.9, high=1)) for i in xrange(nlabels)]
-#                           np.random.uniform(low=0.9, high=1)) for i in range(nlabels)]
-
-#         # Convert HSV list to RGB
-#         randRGBcolors = []
-#         for HSVcolor in randHSVcolors:
-#             randRGBcolors.append(colorsys.hsv_to_rgb(HSVcolor[0], HSVcolor[1], HSVcolor[2]))
-
-    randRGBcolors = np.random.rand(nlabels, 3)
     if type == 'bright':
-        randRGBcolors = randRGBcolors / np.max(randRGBcolors, axis=1, keepdims=True)
+        ## Generate bright colors in HSV space: random hue, moderate to full
+        ##  saturation, and near-full value
+        randHSVcolors = np.empty((nlabels, 3))
+        randHSVcolors[:, 0] = np.random.uniform(low=0.0, high=1, size=nlabels)
+        randHSVcolors[:, 1] = np.random.uniform(low=0.2, high=1, size=nlabels)
+        randHSVcolors[:, 2] = np.random.uniform(low=0.9, high=1, size=nlabels)
+        randRGBcolors = hsv_to_rgb(randHSVcolors)
+    elif type == 'soft':
+        ## Generate soft pastel colors, by limiting the RGB spectrum
+        randRGBcolors = np.random.uniform(low=0.6, high=0.95, size=(nlabels, 3))
+    else:
+        randRGBcolors = np.random.rand(nlabels, 3)
 
     if first_color_black:
         randRGBcolors[0] = [0, 0, 0]
@@ -518,38 +603,32 @@ def rand_cmap(
 
     random_colormap = LinearSegmentedColormap.from_list('new_map', randRGBcolors, N=nlabels)
 
-    # Generate soft pastel colors, by limiting the RGB spectrum
-    if type == 'soft':
-        low = 0.6
-        high = 0.95
-        randRGBcolors = [(np.random.uniform(low=low, high=high),
-                          np.random.uniform(low=low, high=high),
-#                           np.random.uniform(low=low, high=high)) for i in xrange(nlabels)]
-                          np.random.uniform(low=low, high=high)) for i in range(nlabels)]
+    random_colormap.set_bad(bad)
+    random_colormap.set_over(over)
+    random_colormap.set_under(under)
 
-        if first_color_black:
-            randRGBcolors[0] = [0, 0, 0]
+    # Colorbar is only drawn on request: cmap.show_preview()
+    random_colormap.show_preview = functools.partial(_show_cmap_preview, random_colormap, nlabels)
+    if show_colorbar:
+        random_colormap.show_preview()
 
-        if last_color_black:
-            randRGBcolors[-1] = [0, 0, 0]
-        random_colormap = LinearSegmentedColormap.from_list('new_map', randRGBcolors, N=nlabels)
+    return random_colormap
 
-    # Display colorbar
-    if verbose:
-        from matplotlib import colors, colorbar
-        fig, ax = plt.subplots(1, 1, figsize=(6, 0.5))
 
-        bounds = np.linspace(0, nlabels, nlabels + 1)
-        norm = colors.BoundaryNorm(bounds, nlabels)
+def _show_cmap_preview(cmap, nlabels, max_bins=256):
+    """
+    Display a horizontal colorbar of a label colormap.
+    Bins are capped at max_bins; more are not distinguishable at this size.
+    """
+    from matplotlib import colors, colorbar
+    fig, ax = plt.subplots(1, 1, figsize=(6, 0.5))
 
-        cb = colorbar.ColorbarBase(ax, cmap=random_colormap, norm=norm, spacing='proportional', ticks=None,
-                                   boundaries=bounds, format='%1i', orientation=u'horizontal')
+    bounds = np.linspace(0, nlabels, min(nlabels, max_bins) + 1)
+    norm = colors.BoundaryNorm(bounds, nlabels)
 
-    random_colormap.set_bad(bad)
-    random_colormap.set_over(over)
-    random_colormap.set_under(under)
-
-    return random_colormap
+    cb = colorbar.ColorbarBase(ax, cmap=cmap, norm=norm, spacing='proportional', ticks=None,
+                               boundaries=bounds, format='%1i', orientation=u'horizontal')
+    return fig, ax
 
 
 def simple_cmap(
@@ -592,15 +671,15 @@ def simple_cmap(
     cmap = simple_cmap(['w', 'r'])         # white to red colormap
     cmap = simple_cmap(['r', 'b', 'r'])    # red to blue to red
     """
-    from matplotlib.colors import LinearSegmentedColormap, colorConverter
+    from matplotlib.colors import colorConverter
 
     # check inputs
     n_colors = len(colors)
     if n_colors <= 1:
         raise ValueError('Must specify at least two colors')
 
-    # convert colors to rgb
-    colors = [colorConverter.to_rgb(c) for c in colors]
+    # convert colors to an (n_colors, 3) rgb array
+    colors = np.array([colorConverter.to_rgb(c) for c in colors], dtype=np.float64)
 
     ## prep input_values
     input_values = np.array(input_values)
@@ -616,32 +695,23 @@ def simple_cmap(
         raise ValueError('length of input_values must be either 2 or equal to the length of colors')
 
     # set up colormap
-    cdict = {'red': [], 'green': [], 'blue': []}
-    for i, (r, g, b) in enumerate(colors):
-        idx = input_values_norm[i]
-        # print(idx)
-        cdict['red'].append((idx, r, r))
-        cdict['green'].append((idx, g, g))
-        cdict['blue'].append((idx, b, b))
-
-    cmap = LinearSegmentedColormap(
-        name=name, 
-        segmentdata={k: tuple(v) for k, v in cdict.items()},
-        N=N,
-    )
-                                   
-    cmap.set_bad(bad)
-    cmap.set_over(over)
-    cmap.set_under(under)
+    ## segmentdata rows are (x, y0, y1) for each anchor, as (n_colors, 3) arrays
+    segmentdata = {
+        k: np.stack([input_values_norm, colors[:, i], colors[:, i]], axis=1) for i, k in enumerate(['red', 'green', 'blue'])
+    }
 
     import matplotlib
     class LSC_norm(matplotlib.colors.LinearSegmentedColormap):
         def __init__(self, name=name, N=N):
-            super().__init__(name=name, segmentdata={k: tuple(v) for k, v in cdict.items()}, N=N)
+            super().__init__(name=name, segmentdata=segmentdata, N=N)
             self.set_bad(bad)
             self.set_over(over)
             self.set_under(under)
 
+        @staticmethod
+        def fn_norm(X):
+            return fn_norm(X)
+
         def __call__(self, X, alpha=None, bytes=False):
             X_norm = fn_norm(X)
             return super().__call__(X_norm, alpha=alpha, bytes=bytes)
@@ -695,7 +765,74 @@ class Cmap_conjunctive:
 
         self.n_cmaps = len(self.cmaps)
 
-        self.fn_conj_cmap = lambda x: np.prod(np.stack([cmap(x_i) for cmap,x_i in zip(self.cmaps, x.T)], axis=0), axis=0)
+        ## Precompute each colormap's lookup table once, quantized to uint8.
+        ##  Rows [N, N+1, N+2] hold the under, over, and bad colors (same
+        ##  layout as cmap._lut).
+        self._luts_u8 = [np.round(self._make_lut(cmap) * 255).astype(np.uint8) for cmap in self.cmaps]
+
+    @staticmethod
+    def _make_lut(cmap):
+        """
+        Build a (N+3, 4) float32 lookup table for a colormap.
+        """
+        import matplotlib
+
+        N = cmap.N
+        lut = np.empty((N + 3, 4), dtype=np.float32)
+        ## Integer inputs index the colormap's LUT directly. Bypass any
+        ##  subclass __call__ (e.g. input normalization in simple_cmap).
+        lut[:N] = matplotlib.colors.Colormap.__call__(cmap, np.arange(N))
+        lut[N + 0] = cmap.get_under()
+        lut[N + 1] = cmap.get_over()
+        lut[N + 2] = cmap.get_bad()
+        return lut
+
+    @staticmethod
+    def _lut_indices(x_i, N):
+        """
+        Quantize values to LUT indices the same way
+         matplotlib.colors.Colormap.__call__ does.
+        """
+        if np.issubdtype(x_i.dtype, np.integer):
+            idx = x_i.astype(np.intp)
+            mask_bad = np.zeros(idx.shape, dtype=np.bool_)
+        else:
+            mask_bad = np.isnan(x_i)
+            idx = np.multiply(x_i, N, dtype=np.float64)
+            idx[idx == N] = N - 1  ## 1.0 maps to the last color
+            idx[idx < 0] = -1  ## avoid truncation of (-1, 0) to 0
+            np.clip(idx, -1, N, out=idx)
+            idx[mask_bad] = 0
+            idx = idx.astype(np.intp)
+        idx[idx > N - 1] = N + 1  ## over
+        idx[idx < 0] = N  ## under
+        idx[mask_bad] = N + 2  ## bad
+        return idx
+
+    def fn_conj_cmap(self, x):
+        """
+        Multiply the colors from each colormap together.
+
+        Args:
+            x (np.ndarray):
+                Input data. Shape (n_samples, n_cmaps).
+
+        Returns:
+            (np.ndarray):
+                Product of colors, scaled to [0, 255].
+                Shape (n_samples, 4). dtype uint8.
+        """
+        ## Accumulate in uint16: the product of two uint8 values fits, and
+        ##  (t + (t >> 8)) >> 8 with t = a*b + 128 is round(a*b / 255).
+        acc = np.full((x.shape[0], 4), 255, dtype=np.uint16)
+        for cmap, lut, x_i in zip(self.cmaps, self._luts_u8, x.T):
+            ## Colormaps from simple_cmap normalize their inputs before lookup
+            x_i = cmap.fn_norm(x_i) if hasattr(cmap, 'fn_norm') else x_i
+            acc *= lut[self._lut_indices(np.asarray(x_i), cmap.N)]
+            acc += 128
+            acc += acc >> 8
+            acc >>= 8
+        return acc.astype(np.uint8)
 
     def __call__(self, x):
         """
@@ -726,10 +863,11 @@ class Cmap_conjunctive:
             x = (x - x.min(axis=0, keepdims=True)) / (x.max(axis=0, keepdims=True) - x.min(axis=0, keepdims=True))
 
         ## Get colors
-        colors = self.fn_conj_cmap(x)
-        colors = (colors * (self.normalization_range[1] - self.normalization_range[0]) + self.normalization_range[0]).astype(self.dtype_out)
+        colors = self.fn_conj_cmap(x).astype(np.float32)
+        np.multiply(colors, (self.normalization_range[1] - self.normalization_range[0]) / 255, out=colors)
+        colors += self.normalization_range[0]
 
-        return colors
+        return colors.astype(self.dtype_out)
 
 
 def complex_colormap(
@@ -1123,7 +1261,10 @@ class Figure_Saver:
                     print(f'RH Warning: Not saving anything. File exists and overwrite==False. {path} already exists.') if self.verbose > 0 else None
                     return None
             print(f'FR: Saving figure {path} as format(s): {form}') if self.verbose > 1 else None
-            fig.savefig(path, format=form, **self.kwargs_savefig)
+            ## Use the Agg renderer for raster formats regardless of the
+            ##  figure's (possibly interactive) backend
+            kwargs_savefig = {'backend': 'agg', **self.kwargs_savefig} if form.lower() in ('png', 'jpg', 'jpeg', 'tif', 'tiff') else self.kwargs_savefig
+            fig.savefig(path, format=form, **kwargs_savefig)
 
     def save_batch(
         self,
@@ -1183,8 +1324,14 @@ class Select_ROI:
     Only works in a Jupyter notebook.
     Select regions of interest in an image using matplotlib.
     Use %matplotlib notebook or qt backend to use this.
-    It currently uses cv2.polylines to draw the ROIs.
-    Output is self.mask_frames
+    ROIs are drawn as matplotlib lines over the image. Clicks are
+     redrawn using blitting when the backend supports it.
+    Output is self.mask_frames: one boolean mask per ROI, filled with
+     cv2.fillPoly. Vertices are rounded to the nearest pixel, and pixels
+     on the polygon boundary are included. Self-intersecting ROIs are
+     filled in full, including overlapping regions. This is not the
+     even-odd rule used by skimage.draw.polygon. Masks are therefore
+     slightly larger than those made by skimage.draw.polygon.
     RH 2021
     """
 
@@ -1216,10 +1363,18 @@ class Select_ROI:
 
         ## Prepare figure
         self._fig, self._ax = plt.subplots(**kwargs_subplots)
-        self._img_current = self._ax.imshow(self._img_input.copy(), **kwargs_imshow)
+        self._img_current = self._ax.imshow(self._img_input, **kwargs_imshow)
 
-        ## Connect the click event
+        ## Lines for the completed ROIs and for the ROI being drawn.
+        ##  The current line is animated so that it can be blitted on each
+        ##  click without redrawing the image.
+        self._roi_lines = []
+        self._current_line = self._new_line()
+        self._background = None
+
+        ## Connect the click and draw events
         self._buttonRelease = self._fig.canvas.mpl_connect('button_release_event', self._onclick)
+        self._drawEvent = self._fig.canvas.mpl_connect('draw_event', self._on_draw)
         ## Make and connect the buttons
         disconnect_button = widgets.Button(description="Confirm ROI")
         new_ROI_button = widgets.Button(description="New ROI")
@@ -1228,20 +1383,22 @@ class Select_ROI:
         disconnect_button.on_click(self._disconnect_mpl)
         new_ROI_button.on_click(self._new_ROI)
 
-    def _poly_img(self, img, pts):
+    def _new_line(self):
         """
-        Draw a polygon on an image.
+        Make an empty, animated line for drawing an ROI.
         """
-        pts = np.array(pts, np.int32)
-        pts = pts.reshape((-1, 1, 2))
-        cv2.polylines(
-            img=img, 
-            pts=[pts],
-            isClosed=True,
-            color=(255,255,255,),
-            thickness=2
-        )
-        return img
+        line = self._ax.plot([], [], color='w', lw=2)[0]
+        line.set_animated(True)
+        return line
+
+    def _on_draw(self, event):
+        """
+        After a full redraw, cache the background and draw the current line.
+        """
+        canvas = self._fig.canvas
+        if getattr(canvas, 'supports_blit', False):
+            self._background = canvas.copy_from_bbox(self._ax.bbox)
+        self._ax.draw_artist(self._current_line)
 
     def _onclick(self, event):
         """
@@ -1252,34 +1409,44 @@ class Select_ROI:
             return None
         self._selected_points_last_ROI.append([event.xdata, event.ydata])
         if len(self._selected_points_last_ROI) > 1:
-            self._fig
-            im = self._img_input.copy()
-            for ii in range(len(self.selected_points)):
-                im = self._poly_img(im, self.selected_points[ii])
-            im = self._poly_img(im, self._selected_points_last_ROI)
-            self._img_current.set_data(im)
-        self._fig.canvas.draw()
+            ## Close the polygon by repeating the first point
+            pts = np.asarray(self._selected_points_last_ROI + self._selected_points_last_ROI[:1])
+            self._current_line.set_data(pts[:, 0], pts[:, 1])
+
+        canvas = self._fig.canvas
+        if self._background is not None:
+            ## Only redraw the current ROI's line
+            canvas.restore_region(self._background)
+            self._ax.draw_artist(self._current_line)
+            canvas.blit(self._ax.bbox)
+        else:
+            canvas.draw_idle()
 
 
     def _disconnect_mpl(self, _):
         """
         Disconnect the click event and collect the points.
+        Computes self.mask_frames (see class docstring for the fill rule).
         """
-        import skimage.draw
-
         self.selected_points.append(self._selected_points_last_ROI)
 
         self._fig.canvas.mpl_disconnect(self._buttonRelease)
+        self._fig.canvas.mpl_disconnect(self._drawEvent)
         self._completed_status = True
+
+        ## Keep the last ROI visible once blitting stops
+        self._current_line.set_animated(False)
+        self._roi_lines.append(self._current_line)
+        self._fig.canvas.draw_idle()
         
-        self.mask_frames = []
+        ## Rasterize all ROIs into one preallocated uint8 stack
+        masks = np.zeros((len(self.selected_points), self._img_input.shape[0], self._img_input.shape[1]), dtype=np.uint8)
         for ii, pts in enumerate(self.selected_points):
-            pts = np.array(pts)
-            mask_frame = np.zeros((self._img_input.shape[0], self._img_input.shape[1]))
-            pts_y, pts_x = skimage.draw.polygon(pts[:, 1], pts[:, 0])
-            mask_frame[pts_y, pts_x] = 1
-            mask_frame = mask_frame.astype(np.bool_)
-            self.mask_frames.append(mask_frame)
+            if len(pts) == 0:
+                continue
+            pts = np.round(np.asarray(pts)).astype(np.int32).reshape(-1, 1, 2)
+            cv2.fillPoly(masks[ii], [pts], 1)
+        self.mask_frames = list(masks.astype(bool))
         print(f'mask_frames computed')
 
     def _new_ROI(self, _):
@@ -1288,6 +1455,12 @@ class Select_ROI:
         """
         self.selected_points.append(self._selected_points_last_ROI)
         self._selected_points_last_ROI = []
+
+        ## Freeze the current line into the background and start a new one
+        self._current_line.set_animated(False)
+        self._roi_lines.append(self._current_line)
+        self._current_line = self._new_line()
+        self._fig.canvas.draw_idle()
         
     
 class ImageLabeler:
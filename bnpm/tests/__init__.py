@@ -3,5 +3,6 @@ __all__ = [
     'benchmark_all',
     'test_coherence',
     'test_PCA',
+    'test_h5_handling',
     'test_regression',
 ]
\ No newline at end of file
@@ -0,0 +1,71 @@
+import numpy as np
+
+from .. import h5_handling
+
+
+def test_write_dict_to_h5_roundtrip(tmp_path):
+    path = str(tmp_path / 'test.h5')
+    d = {
+        'zero_d': np.array(5.0),
+        'scalar': 3,
+        'string': 'hello',
+        'array': np.arange(12, dtype=np.float32).reshape(3, 4)[:, ::2],
+        'group': {
+            'b': np.ones((2, 2)),
+            'a': {
+                'c': 7.5,
+            },
+        },
+    }
+    h5_handling.write_dict_to_h5(path, d, show_item_tree_pref=False)
+    out = h5_handling.simple_load(path)
+
+    assert out['zero_d'].shape == ()
+    assert out['zero_d'] == 5.0
+    assert out['scalar'].shape == ()
+    assert out['scalar'] == 3
+    assert out['string'] == b'hello'
+    assert np.array_equal(out['array'], d['array'])
+    assert np.array_equal(out['group']['b'], d['group']['b'])
+    assert out['group']['a']['c'] == 7.5
+
+
+def test_show_item_tree_order_and_depth(tmp_path, capsys):
+    path = str(tmp_path / 'test.h5')
+    d = {'group': {'b': np.zeros(3), 'a': {'c': 1}}}
+    h5_handling.write_dict_to_h5(path, d, track_order=True, show_item_tree_pref=False)
+
+    with h5_handling.open_h5(path, 'r') as f:
+        h5_handling.show_item_tree(f)
+        lines = capsys.readouterr().out.splitlines()
+        keys = [line.split('.', 1)[1].split(':')[0].strip() for line in lines]
+        assert keys == ['group', 'b', 'a', 'c']
+
+        h5_handling.show_item_tree(f, depth=0)
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == 1
+
+
+def test_close_all_h5_same_path(tmp_path):
+    path = str(tmp_path / 'test.h5')
+    h5_handling.write_dict_to_h5(path, {'a': np.arange(3)}, show_item_tree_pref=False)
+
+    a = h5_handling.open_h5(path, 'r')
+    b = h5_handling.open_h5(path, 'r')
+    assert len(h5_handling._OPEN_FILES) >= 2
+
+    h5_handling.close_all_h5()
+    assert not a
+    assert not b
+    assert len(h5_handling._OPEN_FILES) == 0
+
+
+def test_write_dict_to_h5_use_compression(tmp_path):
+    path = str(tmp_path / 'test.h5')
+    d = {'small': np.zeros(5000), 'scalar': np.array(1.0)}
+    h5_handling.write_dict_to_h5(path, d, use_compression=True, show_item_tree_pref=False)
+
+    with h5_handling.open_h5(path, 'r') as f:
+        assert f['small'].compression == 'gzip'
+        assert f['scalar'].compression is None
+        assert f['scalar'][()] == 1.0